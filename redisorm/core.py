@@ -1,8 +1,233 @@
+import copy
+import json
+import re
 import redis
+from types import FunctionType as _FunctionType
+from types import SimpleNamespace as _SimpleNamespace
 from . import types
 
 DELETED = "__deleted__"
 SORTED = "__sorted__"
+CHUNK_SIZE = 500
+
+_DEFAULT_POOL = None
+
+# Allocates the next id from a counter; a missing counter yields 0.
+# Shared by update_id and the save script.
+_ALLOCATE_ID = """
+local function allocate_id(counter)
+    redis.call('SET', counter, -1, 'NX')
+    return tostring(redis.call('INCR', counter))
+end
+"""
+
+# KEYS: latest id counter
+_UPDATE_ID_SCRIPT = _ALLOCATE_ID + """
+return allocate_id(KEYS[1])
+"""
+
+# KEYS: latest id counter, object key prefix, sorted set
+# ARGV: id ("" allocates one), #fields to set, #fields to delete,
+#       #indexed columns, "zadd"/"", score, "hash"/"packed", the
+#       tombstone field, then the field/value pairs, the deleted fields and,
+#       for each indexed column, its name and the prefix of its index sets
+#
+# The object and index keys are built inside the script from the prefixes,
+# so they are not declared in KEYS and the script needs a single Redis
+# instance (no Cluster). Redis does not roll back a failing script, so key
+# types are checked before anything is written.
+_SAVE_SCRIPT = _ALLOCATE_ID + """
+local nset, ndel, nidx = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local dels = 9 + 2 * nset
+local idx = dels + ndel
+local packed = ARGV[7] == 'packed'
+local function check(name, expected)
+    local t = redis.call('TYPE', name)['ok']
+    if t ~= 'none' and t ~= expected then
+        return redis.error_reply('WRONGTYPE ' .. name .. ' is a ' .. t)
+    end
+end
+if ARGV[5] ~= '' then
+    if redis.call('TYPE', KEYS[3])['ok'] == 'list' then
+        return redis.error_reply('LEGACYSORTED ' .. KEYS[3] .. ' is a list')
+    end
+    local err = check(KEYS[3], 'zset')
+    if err then return err end
+end
+local names = {}
+for j = 1, nidx do
+    names[j] = ARGV[idx + 2 * j - 2]
+end
+local old = {}
+local id = ARGV[1]
+if id ~= '' then
+    local key = KEYS[2] .. id
+    local err = check(key, packed and 'string' or 'hash')
+    if err then return err end
+    if packed then
+        local raw = redis.call('GET', key)
+        local data = raw and cjson.decode(raw) or {}
+        for j = 1, nidx do
+            old[j] = data[names[j]] or false
+        end
+    else
+        local stored = redis.call('HMGET', key, ARGV[8], unpack(names))
+        if stored[1] then
+            return redis.error_reply('OBJDELETED ' .. key .. ' is deleted')
+        end
+        for j = 1, nidx do
+            old[j] = stored[j + 1]
+        end
+    end
+end
+local new = {}
+for i = 9, dels - 1, 2 do
+    new[ARGV[i]] = ARGV[i + 1]
+end
+for j = 1, nidx do
+    local prefix = ARGV[idx + 2 * j - 1]
+    for _, value in ipairs({old[j] or '', new[names[j]] or ''}) do
+        if value ~= '' then
+            local err = check(prefix .. value, 'set')
+            if err then return err end
+        end
+    end
+end
+if id == '' then
+    id = allocate_id(KEYS[1])
+end
+new.id = id
+local key = KEYS[2] .. id
+local member = id
+if #id < 20 and string.match(id, '^%d+$')
+        and (id == '0' or string.sub(id, 1, 1) ~= '0') then
+    member = string.rep('0', 20 - #id) .. id
+end
+if packed then
+    redis.call('SET', key, cjson.encode(new))
+else
+    redis.call('HSET', key, 'id', id)
+    if nset > 0 then
+        redis.call('HSET', key, unpack(ARGV, 9, dels - 1))
+    end
+    if ndel > 0 then
+        redis.call('HDEL', key, unpack(ARGV, dels, idx - 1))
+    end
+end
+for j = 1, nidx do
+    local prefix = ARGV[idx + 2 * j - 1]
+    local value = new[names[j]]
+    if old[j] and old[j] ~= value then
+        redis.call('SREM', prefix .. old[j], id)
+    end
+    if value then
+        redis.call('SADD', prefix .. value, id)
+    end
+end
+if ARGV[5] == 'zadd' then
+    redis.call('ZADD', KEYS[3], ARGV[6], member)
+end
+return id
+"""
+
+# KEYS: object key, sorted set
+# ARGV: "hash"/"packed", tombstone field, id, sorted member ("" when the
+#       model has no index key), then for each indexed column its name and
+#       the prefix of its index sets
+#
+# The index entries are removed using the stored values, not the caller's
+# copy of the object, which may be stale.
+_DELETE_SCRIPT = """
+local packed = ARGV[1] == 'packed'
+local id = ARGV[3]
+if ARGV[4] ~= '' then
+    local t = redis.call('TYPE', KEYS[2])['ok']
+    if t == 'list' then
+        return redis.error_reply('LEGACYSORTED ' .. KEYS[2] .. ' is a list')
+    elseif t ~= 'none' and t ~= 'zset' then
+        return redis.error_reply('WRONGTYPE ' .. KEYS[2] .. ' is a ' .. t)
+    end
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local names, prefixes = {}, {}
+for i = 5, #ARGV, 2 do
+    names[#names + 1] = ARGV[i]
+    prefixes[#prefixes + 1] = ARGV[i + 1]
+end
+local values = {}
+if packed then
+    local data = cjson.decode(redis.call('GET', KEYS[1]))
+    for j = 1, #names do
+        values[j] = data[names[j]] or false
+    end
+else
+    local stored = redis.call('HMGET', KEYS[1], ARGV[2], unpack(names))
+    if stored[1] then
+        return 0
+    end
+    for j = 1, #names do
+        values[j] = stored[j + 1]
+    end
+end
+for j = 1, #names do
+    if values[j] then
+        local t = redis.call('TYPE', prefixes[j] .. values[j])['ok']
+        if t ~= 'none' and t ~= 'set' then
+            return redis.error_reply('WRONGTYPE ' .. prefixes[j] .. values[j]
+                                     .. ' is a ' .. t)
+        end
+    end
+end
+if packed then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[2], '1')
+end
+for j = 1, #names do
+    if values[j] then
+        redis.call('SREM', prefixes[j] .. values[j], id)
+    end
+end
+if ARGV[4] ~= '' then
+    redis.call('ZREM', KEYS[2], ARGV[4])
+end
+return 1
+"""
+
+
+def _sorted_member(id):
+    # Members with equal scores are ordered lexically, so numeric ids are
+    # zero-padded to keep them in id order.
+    id = str(id)
+    if len(id) < 20 and id.isdigit() and str(int(id)) == id:
+        return id.zfill(20)
+    return id
+
+
+def _sorted_id(member):
+    if len(member) == 20 and member.isdigit():
+        return str(int(member))
+    return member
+
+
+def _glob_escape(pattern):
+    return re.sub(r"([*?\[\]\\])", r"\\\1", pattern)
+
+
+def _freeze(val):
+    if isinstance(val, types.RedisType):
+        return None if val.obj is None else val.freeze()
+    return val
+
+
+def _default_pool():
+    global _DEFAULT_POOL
+    if _DEFAULT_POOL is None:
+        _DEFAULT_POOL = redis.ConnectionPool(encoding='utf-8',
+                                             decode_responses=True)
+    return _DEFAULT_POOL
 
 
 class RedisOrmException(Exception):
@@ -11,28 +236,41 @@ class RedisOrmException(Exception):
 
 class MetaModel(type):
     def __new__(mcs, name, bases, attrs):
-        # Create temporary class
-        cls = super().__new__(mcs, name, bases, attrs)
-        attrs["_columns"] = []
-        attrs["_index_key"] = None
-        for attr in attrs:
-            if attr.startswith("_"):
-                continue
-            if isinstance(cls.__dict__[attr], Column):
-                if cls.__dict__[attr].index_key:
-                    if attrs["_index_key"]:
-                        raise RedisOrmException(
-                            "Model should have only one index key.")
-                    attrs["_index_key"] = attr
-
-                attrs["_columns"].append(attr)
+        columns = [attr for attr, val in attrs.items()
+                   if not attr.startswith("_") and isinstance(val, Column)]
+        index_keys = [attr for attr in columns if attrs[attr].index_key]
+        if len(index_keys) > 1:
+            raise RedisOrmException("Model should have only one index key.")
+        for attr in columns:
+            # A Column shared under another name gets its own copy, since
+            # the descriptor reads the instance slot through its name.
+            if attrs[attr].name not in (None, attr):
+                attrs[attr] = copy.copy(attrs[attr])
+            attrs[attr].name = attr
+        attrs["_columns"] = columns
+        attrs["_column_types"] = [(attr, attrs[attr].type)
+                                  for attr in columns]
+        attrs["_default_factories"] = {
+            attr: _default_factory(attrs[attr].default) for attr in columns}
+        attrs["_index_key"] = index_keys[0] if index_keys else None
+        attrs["_indexed_columns"] = [attr for attr in columns
+                                     if attrs[attr].indexed]
         return super().__new__(mcs, name, bases, attrs)
 
 
+def _default_factory(default):
+    if isinstance(default, _FunctionType):
+        return default
+    return lambda: default
+
+
 class Column():
-    def __init__(self, type=None, default=None, index_key=False):
+    def __init__(self, type=None, default=None, index_key=False,
+                 indexed=False):
+        self.name = None
         self.type = type
         self.default = default
+        self.indexed = indexed
         self.index_key = False
         if index_key:
             if self.type.__orderable__:
@@ -40,8 +278,25 @@ class Column():
             else:
                 raise RedisOrmException()
 
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            obj = instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+        if isinstance(obj, types.RedisType):
+            return obj.obj
+        return obj
+
+    def __set__(self, instance, value):
+        instance.set_column(self.name, value)
+
 
 class Model(metaclass=MetaModel):
+    # Columns fetched by a partial load; None for a complete instance.
+    _loaded_fields = None
+
     def set_column(self, column, obj):
         if self.__class__.__dict__[column].type is None or isinstance(
                 obj, self.__class__.__dict__[column].type):
@@ -50,24 +305,12 @@ class Model(metaclass=MetaModel):
             self.__dict__[column] = self.__class__.__dict__[column].type(obj)
 
     def __init__(self, *args, **kwargs):
+        factories = self._default_factories
         for column in self._columns:
-            import types
-            if isinstance(self.__class__.__dict__[column].default,
-                          types.FunctionType):
-                self.set_column(column, kwargs.get(
-                    column, self.__class__.__dict__[column].default()))
+            if column in kwargs:
+                self.set_column(column, kwargs[column])
             else:
-                self.set_column(column, kwargs.get(
-                    column, self.__class__.__dict__[column].default))
-
-    def __getattribute__(self, attr):
-        obj = object.__getattribute__(self, attr)
-        if isinstance(obj, types.RedisType):
-            return obj.obj
-        return obj
-
-    def __setattr__(self, name, value):
-        self.set_column(name, value)
+                self.set_column(column, factories[column]())
 
 
 class Client():
@@ -75,181 +318,321 @@ class Client():
                  prefix,
                  key_separator=":",
                  id_count="__latest__",
-                 r=None):
+                 r=None,
+                 storage="hash"):
+        if storage not in ("hash", "packed"):
+            raise RedisOrmException(
+                "storage should be either 'hash' or 'packed'.")
         self.prefix = prefix
         self.id_count = id_count
         self.key_separator = key_separator
-        self.r = r or redis.StrictRedis(encoding='utf-8',
-                                        decode_responses=True)
+        self.storage = storage
+        self.r = r or redis.StrictRedis(connection_pool=_default_pool())
+        self._save_script = self.r.register_script(_SAVE_SCRIPT)
+        self._update_id_script = self.r.register_script(_UPDATE_ID_SCRIPT)
+        self._delete_script = self.r.register_script(_DELETE_SCRIPT)
+
+    @staticmethod
+    def configure_pool(**kwargs):
+        global _DEFAULT_POOL
+        kwargs.setdefault("encoding", "utf-8")
+        kwargs.setdefault("decode_responses", True)
+        _DEFAULT_POOL = redis.ConnectionPool(**kwargs)
+        return _DEFAULT_POOL
+
+    def _base_key(self, classname, id):
+        sep = self.key_separator
+        return "%s%s%s%s%s" % (self.prefix, sep, classname, sep, id)
+
+    def _index_name(self, classname, column, value):
+        sep = self.key_separator
+        return "%s%s%s%sby%s%s%s%s" % (self.prefix, sep, classname, sep, sep,
+                                       column, sep, value)
+
+    def _index_args(self, cls, columns=None):
+        args = []
+        for param in cls._indexed_columns:
+            if columns is None or param in columns:
+                args += [param, self._index_name(cls.__name__, param, "")]
+        return args
 
     def update_id(self, obj):
-        classname = obj.__class__.__name__
-        _id = self.get_last_insert_id(classname)
-        if _id is not None:
-            obj.id = _id + 1
-            self.set_id(classname, obj.id)
-        else:
-            obj.id = 0
-            self.set_id(classname, obj.id)
+        obj.id = self._update_id_script(keys=[
+            self._base_key(obj.__class__.__name__, self.id_count)])
         return obj.id
 
     def get_last_insert_id(self, classname):
-        _id = self.r.get(self.key_separator.join([self.prefix, classname,
-                                                  self.id_count]))
+        _id = self.r.get(self._base_key(classname, self.id_count))
         return _id if _id is None else int(_id)
 
     def set_id(self, classname, id):
-        return self.r.set(
-            self.key_separator.join([self.prefix, classname, self.id_count]),
-            str(id))
+        return self.r.set(self._base_key(classname, self.id_count), str(id))
 
     def save(self, obj):
-        r = self.r
         classname = obj.__class__.__name__
+        loaded = obj._loaded_fields
+        if loaded is not None and self.storage == "packed":
+            raise RedisOrmException(
+                "A partially loaded instance cannot be saved in packed "
+                "storage.")
 
-        obj.id = obj.id or self.update_id(obj)
-        obj.id = str(obj.id)
-
+        fields = []
+        deleted = []
+        obj_dict = obj.__dict__
+        freeze = _freeze
         for param in obj._columns:
-            if obj.__dict__[param] is not None:
-                if obj.__class__.__dict__[param].type:
-                    key = self.key_separator.join([self.prefix, classname, str(
-                        obj.id)])
-                    r.hset(key, param,
-                           getattr(obj.__class__,
-                                   param).type(getattr(obj, param)).freeze())
-                else:
-                    r.hset(
-                        self.key_separator.join([self.prefix, classname, obj.id
-                                                 ]), param, getattr(obj,
-                                                                    param))
+            if param == "id" or (loaded is not None and param not in loaded):
+                continue
+            val = freeze(obj_dict[param])
+            if val is None:
+                deleted.append(param)
             else:
-                r.hdel(
-                    self.key_separator.join([self.prefix, classname, obj.id]),
-                    param)
-
-        if obj.__class__._index_key:
-            r.delete(self.key_separator.join([self.prefix, classname, SORTED]))
-            for item in self.load_all(obj.__class__):
-                r.rpush(
-                    self.key_separator.join([self.prefix, classname, SORTED]),
-                    item.id)
-
-    def load(self, cls, key):
-        key = str(key)
-        r = self.r
-        classname = cls.__name__
-
-        if r.hget(
-                self.key_separator.join([self.prefix, classname, key]),
-                DELETED):
+                fields += [param, val]
+        indexed = self._index_args(obj.__class__, loaded)
+
+        sorted_op, score = "", ""
+        index_key = obj.__class__._index_key
+        if index_key and (loaded is None or index_key in loaded):
+            # Objects without an index key value sort first.
+            val = obj_dict[index_key]
+            sorted_op, score = "zadd", "-inf"
+            if val is not None and val.obj is not None:
+                score = val.score()
+
+        keys = [self._base_key(classname, self.id_count),
+                self._base_key(classname, ""),
+                self._base_key(classname, SORTED)]
+        args = ["" if obj.id is None else str(obj.id),
+                len(fields) // 2, len(deleted), len(indexed) // 2,
+                sorted_op, score, self.storage, DELETED
+                ] + fields + deleted + indexed
+        try:
+            obj.id = self._save_script(keys=keys, args=args)
+        except redis.ResponseError as e:
+            if str(e).startswith("OBJDELETED"):
+                raise RedisOrmException(
+                    "%s %s has been deleted." % (classname, obj.id))
+            if str(e).startswith("LEGACYSORTED"):
+                raise self._legacy_sorted(obj.__class__)
+            raise
+
+    def _legacy_sorted(self, cls):
+        return RedisOrmException(
+            "%s is a legacy list; convert it with Client.rebuild_sorted." %
+            self._base_key(cls.__name__, SORTED))
+
+    def _unpack(self, raw):
+        if raw is None:
             return None
-
-        def _load(columns):
-            for column in columns:
-                val = r.hget(
-                    self.key_separator.join([self.prefix, classname, key]),
-                    column)
-                if column != "self" and val is not None:
-                    if cls.__dict__[column].type is None:
-                        yield column, val
-                    else:
-                        yield column, cls.__dict__[column].type(val)
-
-        obj = cls(**dict(_load(cls._columns)))
+        return json.loads(raw)
+
+    def load(self, cls, key, fields=None):
+        name = self._base_key(cls.__name__, key)
+        if self.storage == "packed":
+            data = self._unpack(self.r.get(name))
+            if data is None:
+                return None
+        elif fields is not None:
+            fields = list(fields)
+            values = self.r.hmget(name, [DELETED] + fields)
+            if values[0] is not None:
+                return None
+            data = dict(zip(fields, values[1:]))
+        else:
+            data = self.r.hgetall(name)
+            if DELETED in data:
+                return None
+        if fields is None:
+            return self._materialize(cls, data)
+        kwargs = self._decode(cls, data)
+        for column in cls._columns:
+            if column not in fields:
+                kwargs[column] = None
+        obj = cls(**kwargs)
+        obj.id = str(key)
+        obj._loaded_fields = frozenset(fields)
         return obj
 
+    def _materialize(self, cls, data):
+        return cls(**self._decode(cls, data))
+
+    def _decode(self, cls, data):
+        kwargs = {}
+        get = data.get
+        for column, _type in cls._column_types:
+            val = get(column)
+            if val is None:
+                continue
+            kwargs[column] = val if _type is None else _type(val)
+        return kwargs
+
     def load_all(self,
                  cls,
                  _range=None,
                  reverse=False,
                  ignore_index_key=False):
+        if _range is None or (cls._index_key and not ignore_index_key):
+            _range = self._ids(cls, reverse, ignore_index_key)
+        for _, data in self._iter_raw(cls, _range):
+            yield self._materialize(cls, data)
+
+    def _ids(self, cls, reverse=False, ignore_index_key=False):
+        if cls._index_key and not ignore_index_key:
+            sorted_key = self._base_key(cls.__name__, SORTED)
+            try:
+                members = self.r.zrange(sorted_key, 0, -1, desc=reverse)
+            except redis.ResponseError:
+                if self.r.type(sorted_key) == "list":
+                    raise self._legacy_sorted(cls)
+                raise
+            return [_sorted_id(member) for member in members]
         max_id = self.get_max_id(cls)
         if max_id is None:
-            return
-        if _range is None:
-            if reverse:
-                _range = range(int(max_id), -1, -1)
-            else:
-                _range = range(int(max_id) + 1)
-        if cls._index_key and not ignore_index_key:
-            k = self.load_all_only_keys(cls, "id", ignore_index_key=True)
-            v = self.load_all_only_keys(
-                cls, cls._index_key, ignore_index_key=True)
-            kv = zip(k, v)
-            if kv is None:
-                return
-            for i, _ in sorted(kv, key=lambda tp: tp[1]):
-                obj = self.load(cls, str(i))
-                if obj is not None:
-                    yield obj
-        else:
-            for i in _range:
-                obj = self.load(cls, str(i))
-                if obj is not None:
-                    yield obj
+            return []
+        if reverse:
+            return range(int(max_id), -1, -1)
+        return range(int(max_id) + 1)
+
+    def _iter_raw(self, cls, ids):
+        base = self._base_key(cls.__name__, "")
+        ids = list(ids)
+        pipe = self.r.pipeline(transaction=False)
+        packed = self.storage == "packed"
+        fetch = pipe.get if packed else pipe.hgetall
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            for i in chunk:
+                fetch(base + str(i))
+            for i, data in zip(chunk, pipe.execute()):
+                if packed:
+                    if data is not None:
+                        yield i, json.loads(data)
+                elif DELETED not in data:
+                    yield i, data
 
     def load_all_only_keys(
             self, cls, key,
             reverse=False,
             ignore_index_key=False):
-        if ignore_index_key or cls._index_key is None:
-            max_id = self.get_max_id(cls)
-            classname = cls.__name__
-            if max_id is None:
-                return
-            _range = range(int(max_id) + 1)
-            if reverse is True:
-                _range = range(int(max_id), -1, -1)
-            for i in _range:
-                obj = self.r.hget(
-                    self.key_separator.join([self.prefix, classname, str(i)]),
-                    key)
-                obj_deleted_flag = self.r.hget(
-                    self.key_separator.join([self.prefix, classname, str(i)]),
-                    DELETED)
-                if obj_deleted_flag is None:
-                    yield obj
-        else:
-            k = self.load_all_only_keys(
-                cls, cls._index_key, ignore_index_key=True)
-            v = self.load_all_only_keys(cls, key, ignore_index_key=True)
-            kv = zip(k, v)
-            for _, val in sorted(kv, key=lambda tp: tp[0]):
-                yield val
+        ids = self._ids(cls, reverse, ignore_index_key)
+        for _, values in self._iter_fields(cls, [key], ids):
+            yield values[0]
+
+    def _iter_fields(self, cls, fields, ids):
+        ids = list(ids)
+        if self.storage == "packed":
+            for i, data in self._iter_raw(cls, ids):
+                yield i, [data.get(field) for field in fields]
+            return
+        base = self._base_key(cls.__name__, "")
+        pipe = self.r.pipeline(transaction=False)
+        hmget = pipe.hmget
+        fields = [DELETED] + list(fields)
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            for i in chunk:
+                hmget(base + str(i), fields)
+            for i, values in zip(chunk, pipe.execute()):
+                if values[0] is None:
+                    yield i, values[1:]
 
     def find(self, cls, cond):
-        for item in self.load_all(cls):
-            if cond(item) is True:
-                return item
+        factories = cls._default_factories
+        for _, data in self._iter_raw(cls, self._ids(cls)):
+            kwargs = self._decode(cls, data)
+            values = {}
+            proxy = {}
+            for column, _type in cls._column_types:
+                val = kwargs[column] if column in kwargs else factories[
+                    column]()
+                if _type is not None and not isinstance(val, _type):
+                    val = _type(val)
+                values[column] = val
+                if isinstance(val, types.RedisType):
+                    val = val.obj
+                proxy[column] = val
+            if cond(_SimpleNamespace(**proxy)) is True:
+                return cls(**values)
         return None
 
     def find_by(self, cls, key, value):
-        max_id = self.get_max_id(cls)
-        classname = cls.__name__
-        if max_id is None:
-            return
-        for i in range(int(max_id) + 1):
-            name = self.key_separator.join([self.prefix, classname, str(i)])
-            if self.r.hget(name, key) == value:
+        if key in cls._indexed_columns:
+            ids = self.r.smembers(
+                self._index_name(cls.__name__, key, str(value)))
+            for i in sorted(ids, key=_sorted_member):
+                obj = self.load(cls, i)
+                if obj is not None:
+                    return obj
+            return None
+        ids = self._ids(cls, ignore_index_key=True)
+        for i, values in self._iter_fields(cls, [key], ids):
+            if values[0] == value:
                 return self.load(cls, i)
         return None
 
+    def rebuild_index(self, cls):
+        indexed = cls._indexed_columns
+        if not indexed:
+            return
+        entries = {param: {} for param in indexed}
+        ids = self._ids(cls, ignore_index_key=True)
+        for i, values in self._iter_fields(cls, indexed, ids):
+            for param, val in zip(indexed, values):
+                if val is not None:
+                    entries[param].setdefault(str(val), []).append(str(i))
+        pipe = self.r.pipeline()
+        for param, mapping in entries.items():
+            prefix = self._index_name(cls.__name__, param, "")
+            stale = list(self.r.scan_iter(match=_glob_escape(prefix) + "*"))
+            for start in range(0, len(stale), CHUNK_SIZE):
+                pipe.delete(*stale[start:start + CHUNK_SIZE])
+            for val, ids in mapping.items():
+                pipe.sadd(prefix + val, *ids)
+        pipe.execute()
+
+    def rebuild_sorted(self, cls):
+        index_key = cls._index_key
+        if index_key is None:
+            return
+        _type = cls.__dict__[index_key].type
+        sorted_key = self._base_key(cls.__name__, SORTED)
+
+        def rebuild(pipe):
+            scores = []
+            ids = self._ids(cls, ignore_index_key=True)
+            for i, values in self._iter_fields(cls, [index_key], ids):
+                score = "-inf"
+                if values[0] is not None:
+                    score = _type(values[0]).score()
+                scores.append((_sorted_member(i), score))
+            pipe.multi()
+            pipe.delete(sorted_key)
+            for start in range(0, len(scores), CHUNK_SIZE):
+                pipe.zadd(sorted_key, dict(scores[start:start + CHUNK_SIZE]))
+
+        # Saves and deletes touch one of the watched keys, so a concurrent
+        # write makes the transaction fail and the rebuild start over.
+        self.r.transaction(rebuild, sorted_key,
+                           self._base_key(cls.__name__, self.id_count))
+
     def get_max_id(self, cls):
-        classname = cls.__name__
-        if not self.r.exists(self.key_separator.join([self.prefix, classname,
-                                                      self.id_count])):
-            return None
-        return int(self.r.get(self.key_separator.join([self.prefix, classname,
-                                                       self.id_count])))
+        return self.get_last_insert_id(cls.__name__)
 
     def delete(self, obj):
-        classname = obj.__class__.__name__
+        cls = obj.__class__
         if obj.id is None:
             return False
-        return self.r.hset(
-            self.key_separator.join([self.prefix, classname, obj.id]), DELETED,
-            "1")
+        keys = [self._base_key(cls.__name__, obj.id),
+                self._base_key(cls.__name__, SORTED)]
+        args = [self.storage, DELETED, str(obj.id),
+                _sorted_member(obj.id) if cls._index_key else ""
+                ] + self._index_args(cls)
+        try:
+            return self._delete_script(keys=keys, args=args)
+        except redis.ResponseError as e:
+            if str(e).startswith("LEGACYSORTED"):
+                raise self._legacy_sorted(cls)
+            raise
 
 # backword compatible
 Persistent = Client
@@ -31,6 +31,9 @@ class Integer(RedisType):
     def freeze(self):
         return str(self.obj)
 
+    def score(self):
+        return self.obj
+
 
 class DateTime(RedisType):
     __orderable__ = True
@@ -46,6 +49,10 @@ class DateTime(RedisType):
     def freeze(self):
         return self.obj.strftime("%Y-%m-%d %H:%M:%S")
 
+    def score(self):
+        import calendar
+        return calendar.timegm(self.obj.utctimetuple())
+
 
 class Boolean(RedisType):
     @classmethod
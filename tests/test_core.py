@@ -153,3 +153,321 @@ def test_types(test_redis):
     example.message = "message"
     assert isinstance(example.id, int)
     assert isinstance(example.message, str)
+
+
+def test_load_all_across_chunks(test_redis, monkeypatch):
+    import redisorm.core
+    monkeypatch.setattr(redisorm.core, "CHUNK_SIZE", 2)
+    p = Persistent("example", r=test_redis)
+    objs = [SamplePersistentObject(arg01=str(i)) for i in range(5)]
+    for obj in objs:
+        p.save(obj)
+    p.delete(objs[2])
+    assert [item.arg01 for item in p.load_all(SamplePersistentObject)
+            ] == ["0", "1", "3", "4"]
+
+
+class IndexedObject(PersistentData):
+    id = Column()
+    name = Column(indexed=True)
+
+
+def test_find_by_indexed_column(test_redis):
+    p = Persistent("example", r=test_redis)
+    p.save(IndexedObject(name="foo"))
+    obj = IndexedObject(name="bar")
+    p.save(obj)
+    assert p.find_by(IndexedObject, "name", "bar").id == "1"
+    assert test_redis.smembers("example:IndexedObject:by:name:foo") == {"0"}
+    assert test_redis.smembers("example:IndexedObject:by:name:bar") == {"1"}
+    obj.name = "baz"
+    p.save(obj)
+    assert not test_redis.exists("example:IndexedObject:by:name:bar")
+    assert p.find_by(IndexedObject, "name", "bar") is None
+    assert p.find_by(IndexedObject, "name", "baz").id == "1"
+    p.delete(obj)
+    assert p.find_by(IndexedObject, "name", "baz") is None
+
+
+def test_persistents_share_default_pool():
+    assert Persistent("a").r.connection_pool is Persistent(
+        "b").r.connection_pool
+
+
+def test_configure_pool(monkeypatch):
+    import redisorm.core
+    monkeypatch.setattr(redisorm.core, "_DEFAULT_POOL", None)
+    pool = Persistent.configure_pool(max_connections=4)
+    assert pool.max_connections == 4
+    assert Persistent("example").r.connection_pool is pool
+
+
+def test_column_is_descriptor():
+    assert isinstance(SamplePersistentObject.arg01, Column)
+    obj = SamplePersistentObject(arg01="hoge")
+    obj.arg01 = "fuga"
+    assert obj.__dict__["arg01"] == "fuga"
+
+
+def test_column_callable_default():
+    calls = []
+
+    def default():
+        calls.append(1)
+        return "generated"
+
+    class Example(PersistentData):
+        id = Column()
+        value = Column(default=default)
+
+    assert Example().value == "generated"
+    assert Example(value="given").value == "given"
+    assert len(calls) == 1
+
+
+def test_find(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        count = Column(type=types.Integer)
+        label = Column(default="none")
+
+    p = Persistent("example", r=test_redis)
+    first = Example(count=1)
+    p.save(first)
+    p.save(Example(count=2))
+    p.save(Example(count=2, label="second"))
+    p.delete(first)
+    found = p.find(Example, lambda item: item.count == 2)
+    assert isinstance(found, Example)
+    assert found.id == "1"
+    assert found.label == "none"
+    assert p.find(Example, lambda item: item.count == 1) is None
+
+
+def test_update_id_continues_from_latest(test_redis):
+    p = Persistent("example", r=test_redis)
+    p.set_id("SamplePersistentObject", 41)
+    obj = SamplePersistentObject()
+    p.save(obj)
+    assert obj.id == "42"
+    assert p.get_last_insert_id("SamplePersistentObject") == 42
+
+
+def test_find_by_skips_deleted(test_redis):
+    p = Persistent("example", r=test_redis)
+    obj1 = SamplePersistentObject(arg01="first", arg02="target")
+    obj2 = SamplePersistentObject(arg01="second", arg02="target")
+    p.save(obj1)
+    p.save(obj2)
+    p.delete(obj1)
+    assert p.find_by(SamplePersistentObject, "arg02", "target").id == "1"
+
+
+def test_packed_storage(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        name = Column(indexed=True)
+        created_at = Column(types.DateTime, index_key=True)
+
+    p = Persistent("example", r=test_redis, storage="packed")
+    first = Example(name="foo", created_at="2016-05-08 02:00:00")
+    p.save(first)
+    p.save(Example(name="bar", created_at="2016-05-08 01:00:00"))
+    assert test_redis.type("example:Example:0") == "string"
+    loaded = p.load(Example, 0)
+    assert loaded.name == "foo"
+    assert loaded.created_at == first.created_at
+    assert [item.id for item in p.load_all(Example)] == ["1", "0"]
+    assert list(p.load_all_only_keys(Example, "name")) == ["bar", "foo"]
+    assert p.find_by(Example, "name", "bar").id == "1"
+    p.delete(first)
+    assert p.load(Example, 0) is None
+    assert [item.id for item in p.load_all(Example)] == ["1"]
+
+
+def test_unknown_storage():
+    with pytest.raises(RedisOrmException):
+        Persistent("example", storage="unknown")
+
+
+def test_load_fields(test_redis):
+    p = Persistent("example", r=test_redis)
+    obj = SamplePersistentObject2(arg01="hoge", arg02="fuga", arg03="piyo")
+    p.save(obj)
+    loaded = p.load(SamplePersistentObject2, 0, fields=["id", "arg02"])
+    assert loaded.id == "0"
+    assert loaded.arg01 is None
+    assert loaded.arg02 == "fuga"
+    assert loaded.arg03 is None
+    assert p.load(SamplePersistentObject2, 0, fields=["arg02"]).id == "0"
+    p.delete(obj)
+    assert p.load(SamplePersistentObject2, 0, fields=["arg02"]) is None
+
+
+def test_save_partially_loaded_writes_loaded_fields(test_redis):
+    p = Persistent("example", r=test_redis)
+    p.save(SamplePersistentObject2(arg01="hoge", arg02="fuga", arg03="piyo"))
+    loaded = p.load(SamplePersistentObject2, 0, fields=["arg02"])
+    loaded.arg02 = "changed"
+    p.save(loaded)
+    assert loaded.id == "0"
+    assert p.get_last_insert_id("SamplePersistentObject2") == 0
+    full = p.load(SamplePersistentObject2, 0)
+    assert (full.arg01, full.arg02, full.arg03) == ("hoge", "changed", "piyo")
+
+
+def test_save_partially_loaded_packed_is_rejected(test_redis):
+    p = Persistent("example", r=test_redis, storage="packed")
+    p.save(SamplePersistentObject2(arg01="hoge", arg02="fuga"))
+    loaded = p.load(SamplePersistentObject2, 0, fields=["arg02"])
+    assert loaded.id == "0"
+    with pytest.raises(RedisOrmException):
+        p.save(loaded)
+    assert p.load(SamplePersistentObject2, 0).arg01 == "hoge"
+
+
+@pytest.mark.parametrize("storage", ["hash", "packed"])
+def test_find_by_indexed_column_with_shared_value(test_redis, storage):
+    p = Persistent("example", r=test_redis, storage=storage)
+    a = IndexedObject(name="foo")
+    b = IndexedObject(name="foo")
+    p.save(a)
+    p.save(b)
+    a.name = "bar"
+    p.save(a)
+    assert p.find_by(IndexedObject, "name", "foo").id == b.id
+    p.delete(a)
+    assert p.find_by(IndexedObject, "name", "foo").id == b.id
+
+    c = IndexedObject(name="baz")
+    d = IndexedObject(name="baz")
+    p.save(c)
+    p.save(d)
+    p.delete(c)
+    assert p.find_by(IndexedObject, "name", "baz").id == d.id
+
+
+@pytest.mark.parametrize("storage", ["hash", "packed"])
+def test_find_by_indexed_column_returns_lowest_id(test_redis, storage):
+    p = Persistent("example", r=test_redis, storage=storage)
+    a = IndexedObject(name="foo")
+    b = IndexedObject(name="foo")
+    p.save(a)
+    p.save(b)
+    assert p.find_by(IndexedObject, "name", "foo").id == a.id
+    b.name = "bar"
+    p.save(b)
+    assert p.find_by(IndexedObject, "name", "foo").id == a.id
+    assert p.find_by(IndexedObject, "name", "bar").id == b.id
+
+
+def test_rebuild_index_backfills_existing_objects(test_redis):
+    p = Persistent("example", r=test_redis)
+
+    class Backfilled(PersistentData):
+        id = Column()
+        name = Column()
+
+    p.save(Backfilled(name="foo"))
+    p.save(Backfilled(name="bar"))
+    p.save(Backfilled(name="foo"))
+
+    class Backfilled(PersistentData):
+        id = Column()
+        name = Column(indexed=True)
+
+    assert p.find_by(Backfilled, "name", "bar") is None
+    p.rebuild_index(Backfilled)
+    assert p.find_by(Backfilled, "name", "bar").id == "1"
+    assert p.find_by(Backfilled, "name", "foo").id == "0"
+    test_redis.sadd("example:Backfilled:by:name:stale", "1")
+    p.rebuild_index(Backfilled)
+    assert test_redis.smembers("example:Backfilled:by:name:foo") == {"0", "2"}
+    assert not test_redis.exists("example:Backfilled:by:name:stale")
+
+
+def test_find_condition_sees_model_values(test_redis):
+    import datetime
+    counter = []
+
+    def next_token():
+        counter.append(1)
+        return str(len(counter))
+
+    class Example(PersistentData):
+        id = Column()
+        created_at = Column(types.DateTime, default="2016-05-08 00:00:00")
+        token = Column(default=next_token)
+
+    p = Persistent("example", r=test_redis)
+    test_redis.hset("example:Example:0", "id", "0")
+    p.set_id("Example", 0)
+    seen = []
+
+    def cond(item):
+        seen.append((item.created_at, item.token))
+        return True
+
+    found = p.find(Example, cond)
+    assert seen == [(datetime.datetime(2016, 5, 8), "1")]
+    assert found.created_at == seen[0][0]
+    assert found.token == "1"
+    assert len(counter) == 1
+
+
+def test_save_fails_before_writing_on_wrong_key_type(test_redis):
+    p = Persistent("example", r=test_redis)
+    test_redis.set("example:IndexedObject:by:name:foo", "not a set")
+    with pytest.raises(redis.ResponseError):
+        p.save(IndexedObject(name="foo"))
+    assert p.get_last_insert_id("IndexedObject") is None
+    assert not test_redis.exists("example:IndexedObject:0")
+
+
+def test_packed_storage_stringifies_untyped_values(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        n = Column()
+
+    p = Persistent("example", r=test_redis, storage="packed")
+    p.save(Example(n=5))
+    assert p.load(Example, 0).n == "5"
+    assert p.find_by(Example, "n", "5").id == "0"
+
+
+def test_update_id(test_redis):
+    p = Persistent("example", r=test_redis)
+    obj = SamplePersistentObject()
+    assert p.update_id(obj) == "0"
+    assert obj.id == "0"
+    assert p.update_id(SamplePersistentObject()) == "1"
+    p.save(obj)
+    assert p.get_last_insert_id("SamplePersistentObject") == 1
+    other = SamplePersistentObject()
+    p.save(other)
+    assert other.id == "2"
+
+
+@pytest.mark.parametrize("storage", ["hash", "packed"])
+def test_delete_unindexes_stored_values(test_redis, storage):
+    p = Persistent("example", r=test_redis, storage=storage)
+    obj = IndexedObject(name="foo")
+    p.save(obj)
+    stale = p.load(IndexedObject, obj.id)
+    obj.name = "bar"
+    p.save(obj)
+    assert p.delete(stale) == 1
+    assert p.find_by(IndexedObject, "name", "bar") is None
+    assert not test_redis.exists("example:IndexedObject:by:name:bar")
+    assert p.delete(stale) == 0
+
+
+def test_save_refuses_deleted_object(test_redis):
+    p = Persistent("example", r=test_redis)
+    obj = IndexedObject(name="foo")
+    p.save(obj)
+    p.delete(obj)
+    with pytest.raises(RedisOrmException):
+        p.save(obj)
+    assert p.find_by(IndexedObject, "name", "foo") is None
+    assert not test_redis.exists("example:IndexedObject:by:name:foo")
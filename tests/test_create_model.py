@@ -19,3 +19,14 @@ def test_create_model(test_redis):
     user = UserModel(name="John")
     p.save(user)
     assert p.load(UserModel, 0).name == "John"
+
+
+def test_create_model_with_shared_column():
+    column = Column(default="")
+    Other = create_model("Other", id=Column(), label=column)
+    UserModel = create_model("UserModel", id=Column(), first=column,
+                             last=column)
+    user = UserModel(first="John", last="Smith")
+    assert user.first == "John"
+    assert user.last == "Smith"
+    assert Other(label="x").label == "x"
@@ -3,6 +3,12 @@ import os
 import redis
 
 from redisorm import Persistent, PersistentData, Column, types
+from redisorm import RedisOrmException
+
+
+def sorted_ids(r):
+    return [str(int(member))
+            for member in r.zrange("example:Example:__sorted__", 0, -1)]
 
 
 @pytest.fixture
@@ -62,14 +68,152 @@ def test_persistent_data_save_and_load_with_index_key(test_redis):
     p = Persistent("example", r=test_redis)
     example = Example()
     p.save(example)
-    assert test_redis.lrange("example:Example:__sorted__", 0, -1) == ["0"]
+    assert sorted_ids(test_redis) == ["0"]
     p.save(Example(created_at="2016-05-08 01:00:00"))
     p.save(Example(created_at="2016-05-08 02:00:00"))
     p.save(Example(created_at="2016-05-08 05:00:00"))
     p.save(Example(created_at="2016-05-08 04:00:00"))
-    assert test_redis.lrange("example:Example:__sorted__", 0, -
-                             1) == ["0", "1", "2", "4", "3"]
+    assert sorted_ids(test_redis) == ["0", "1", "2", "4", "3"]
     assert [str(item.id)
             for item in p.load_all(Example)] == ["0", "1", "2", "4", "3"]
     assert [item for item in p.load_all_only_keys(Example, "id")
             ] == ["0", "1", "2", "4", "3"]
+
+
+def test_delete_removes_id_from_sorted_set(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis)
+    first = Example(rank=3)
+    p.save(first)
+    p.save(Example(rank=1))
+    p.save(Example(rank=2))
+    assert [item.id for item in p.load_all(Example)] == ["1", "2", "0"]
+    p.delete(first)
+    assert sorted_ids(test_redis) == [
+        "1", "2"]
+
+
+def test_load_all_reverse_with_index_key(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis)
+    for rank in [2, 10, 1]:
+        p.save(Example(rank=rank))
+    assert [item.id for item in p.load_all(Example, reverse=True)
+            ] == ["1", "0", "2"]
+    assert list(p.load_all_only_keys(Example, "rank")) == ["1", "2", "10"]
+    assert list(p.load_all_only_keys(Example, "rank", reverse=True)
+                ) == ["10", "2", "1"]
+
+
+def test_rebuild_sorted_replaces_legacy_list(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis)
+    for rank in [3, 1, 2]:
+        p.save(Example(rank=rank))
+    test_redis.delete("example:Example:__sorted__")
+    test_redis.rpush("example:Example:__sorted__", "0", "1", "2")
+    p.rebuild_sorted(Example)
+    assert sorted_ids(test_redis) == [
+        "1", "2", "0"]
+
+
+def test_unset_index_key_sorts_first(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis)
+    obj = Example(rank=2)
+    p.save(obj)
+    p.save(Example())
+    p.save(Example(rank=1))
+    assert [item.id for item in p.load_all(Example)] == ["1", "2", "0"]
+    assert list(p.load_all_only_keys(Example, "id")) == ["1", "2", "0"]
+    assert p.find(Example, lambda item: item.rank is None).id == "1"
+    obj.rank = None
+    p.save(obj)
+    assert [item.id for item in p.load_all(Example)] == ["0", "1", "2"]
+    assert p.load(Example, 0).rank is None
+    p.rebuild_sorted(Example)
+    assert sorted_ids(test_redis) == ["0", "1", "2"]
+
+
+def test_equal_index_keys_keep_id_order(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis)
+    for _ in range(12):
+        p.save(Example(rank=1))
+    p.save(Example(rank=0))
+    expected = ["12"] + [str(i) for i in range(12)]
+    assert [item.id for item in p.load_all(Example)] == expected
+    assert list(p.load_all_only_keys(Example, "id")) == expected
+    p.rebuild_sorted(Example)
+    assert [item.id for item in p.load_all(Example)] == expected
+
+
+@pytest.mark.parametrize("storage", ["hash", "packed"])
+def test_legacy_sorted_list_requires_rebuild(test_redis, storage):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis, storage=storage)
+    for rank in [3, 1, 2, 4]:
+        p.save(Example(rank=rank))
+    test_redis.delete("example:Example:__sorted__")
+    test_redis.rpush("example:Example:__sorted__", "0", "1", "2", "3")
+
+    with pytest.raises(RedisOrmException):
+        list(p.load_all(Example))
+    with pytest.raises(RedisOrmException):
+        p.save(Example(rank=0))
+    with pytest.raises(RedisOrmException):
+        p.delete(p.load(Example, 2))
+    assert p.get_last_insert_id("Example") == 3
+    assert p.load(Example, 2) is not None
+    assert test_redis.type("example:Example:__sorted__") == "list"
+
+    p.rebuild_sorted(Example)
+    assert [item.id for item in p.load_all(Example)] == ["1", "2", "0", "3"]
+    p.save(Example(rank=0))
+    p.delete(p.load(Example, 2))
+    assert sorted_ids(test_redis) == ["4", "1", "0", "3"]
+
+
+def test_rebuild_sorted_retries_on_concurrent_write(test_redis):
+    class Example(PersistentData):
+        id = Column()
+        rank = Column(types.Integer, index_key=True)
+
+    p = Persistent("example", r=test_redis)
+    for rank in [3, 1, 2]:
+        p.save(Example(rank=rank))
+    test_redis.delete("example:Example:__sorted__")
+    test_redis.rpush("example:Example:__sorted__", "0", "1", "2")
+    iter_fields = p._iter_fields
+    calls = []
+
+    def concurrent(*args):
+        calls.append(1)
+        if len(calls) == 1:
+            test_redis.hset("example:Example:3", mapping={"id": "3",
+                                                          "rank": "0"})
+            p.set_id("Example", 3)
+        return iter_fields(*args)
+
+    p._iter_fields = concurrent
+    p.rebuild_sorted(Example)
+    assert len(calls) == 2
+    assert sorted_ids(test_redis) == ["3", "1", "2", "0"]
@@ -20,3 +20,8 @@ def test_type_boolean():
     assert types.Boolean(True).freeze() == "True"
     assert types.Boolean("False").freeze() == "False"
     assert types.Boolean(False).freeze() == "False"
+
+
+def test_type_score():
+    assert types.Integer("123").score() == 123
+    assert types.DateTime('1970-01-01 00:01:00').score() == 60